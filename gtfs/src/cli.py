@@ -0,0 +1,166 @@
+"""
+    Date: 2026-10-19
+    Author: Andrew Lindstrom
+    Purpose:
+        Lightweight entry point. Listing routes and serving cached
+        results only use the standard library, pandas/numpy/PyPDF2
+        are imported when an analysis actually has to run
+"""
+import os
+import sys
+import csv
+import glob
+import time
+import logging
+import argparse
+import importlib
+
+from io import TextIOWrapper
+from zipfile import ZipFile
+
+_START = time.perf_counter()
+
+DATA_PATH = os.path.join(
+    os.path.dirname(
+        os.path.dirname(
+            __file__
+        )
+    ),
+    "data"
+)
+OUTPUT_PATH = os.path.join(
+    os.path.dirname(
+        os.path.dirname(
+            __file__
+        )
+    ),
+    "output"
+)
+
+# cached file -> glob of the inputs it is built from
+CACHED_FILES = {
+    os.path.join(DATA_PATH, "stop_level_ridership_data.csv"): os.path.join(
+        DATA_PATH, "stop_level_passenger_census_*.pdf"
+    ),
+    os.path.join(OUTPUT_PATH, "full trimet data.csv"): os.path.join(
+        DATA_PATH, "trimet_gtfs_*.zip"
+    ),
+    os.path.join(OUTPUT_PATH, "scored trimet data.csv"): os.path.join(
+        DATA_PATH, "trimet_gtfs_*.zip"
+    ),
+}
+
+IMPORT_TIMES = {}
+
+
+def lazy_import(
+    name: str
+):
+    """Import a module on first use, recording how long it took"""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES[name] = time.perf_counter() - start
+    logging.debug(f"Imported {name} in {IMPORT_TIMES[name]*1000:.1f} ms")
+    return module
+
+
+def list_routes(
+    zip_path: os.PathLike = None
+) -> list:
+    """Read routes.txt straight out of the feed zip, no pandas"""
+    if not zip_path:
+        zip_path = os.path.join(DATA_PATH, "trimet_gtfs_2023_01_11.zip")
+    with ZipFile(zip_path, 'r') as zf:
+        with zf.open("routes.txt") as f:
+            reader = csv.DictReader(TextIOWrapper(f, encoding="utf-8-sig"))
+            return [
+                (r["route_id"], r.get("route_short_name"), r.get("route_long_name"))
+                for r in reader
+            ]
+
+
+def cache_status(
+    path: os.PathLike
+) -> str:
+    """'fresh', 'stale' or 'missing' for one cached file, by comparing
+    mtimes against its inputs"""
+    if not os.path.isfile(path):
+        return "missing"
+    inputs = glob.glob(CACHED_FILES.get(path, ""))
+    if any(os.path.getmtime(f) > os.path.getmtime(path) for f in inputs):
+        return "stale"
+    return "fresh"
+
+
+def read_cached(
+    path: os.PathLike,
+    route_id = None
+) -> list:
+    """Rows of a cached csv as dicts, optionally for a single route"""
+    if cache_status(path) == "missing":
+        raise FileNotFoundError(f"No cached results at {path}")
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    if route_id is not None:
+        rows = [r for r in rows if r.get("route_id") == str(route_id)]
+    return rows
+
+
+def main(
+    argv: list = None
+):
+    """Process Driver."""
+    parser = argparse.ArgumentParser(description="TriMet transit metrics")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        help="report startup and heavy import times on exit"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("routes", help="list routes in a feed")
+    p.add_argument("zip_path", nargs="?")
+    sub.add_parser("cache", help="show freshness of cached results")
+    p = sub.add_parser("scores", help="print cached timetable quality scores")
+    p.add_argument("--route")
+    sub.add_parser("run", help="run the full trimet analysis")
+    sub.add_parser("ridership", help="parse the ridership pdfs")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=10 if args.verbose else 20
+    )
+    try:
+        if args.command == "routes":
+            routes = list_routes(args.zip_path)
+            writer = csv.writer(sys.stdout)
+            writer.writerow(["route_id","route_short_name","route_long_name"])
+            writer.writerows(routes)
+        elif args.command == "cache":
+            for path in CACHED_FILES:
+                print(f"{cache_status(path)}\t{path}")
+        elif args.command == "scores":
+            path = os.path.join(OUTPUT_PATH, "scored trimet data.csv")
+            if cache_status(path) == "stale":
+                logging.warning(f"{path} is older than its input feeds")
+            rows = read_cached(path, route_id=args.route)
+            writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]) if rows else [])
+            writer.writeheader()
+            writer.writerows(rows)
+        elif args.command == "run":
+            lazy_import("trimet").main()
+        elif args.command == "ridership":
+            lazy_import("pdf_parser").main()
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    if args.timing:
+        for name, seconds in IMPORT_TIMES.items():
+            logging.info(f"import {name}: {seconds*1000:.1f} ms")
+        logging.info(f"total: {(time.perf_counter() - _START)*1000:.1f} ms")
+    return True
+
+if __name__ == "__main__":
+    main()
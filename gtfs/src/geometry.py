@@ -0,0 +1,395 @@
+"""
+    Date: 2026-10-19
+    Author: Andrew Lindstrom
+    Purpose:
+        Shape geometry - distance along shapes.txt, stop projection onto
+        shapes and per segment distance/speed between consecutive stops.
+        Doesn't need the optional shape_dist_traveled columns
+"""
+import time
+import logging
+
+import pandas as pd
+import numpy as np
+
+from kernels import (
+    EARTH_RADIUS_M, HAS_NUMBA, compiled, group_offsets,
+    grouped_diff, grouped_shift, haversine, time_to_seconds
+)
+
+METERS_PER_MILE = 1609.344
+
+
+def _candidate_loop(
+    px, py, cum, sx, sy, max_offset, cand_stop, cand_along, cand_dist, nearest
+):
+    """_stop_candidates kernel, run through compiled(). Fills the
+    cand_ buffers up to their length and returns how many candidates
+    there are, so the caller can retry with bigger buffers"""
+    n = 0
+    max_d2 = max_offset*max_offset
+    dx = px[1:] - px[:-1]
+    dy = py[1:] - py[:-1]
+    # same operations in the same order as the numpy path, so near
+    # ties between segments break the same way
+    length2 = dx*dx + dy*dy
+    inv = np.zeros(len(dx))
+    for j in range(len(dx)):
+        if length2[j] > 0:
+            inv[j] = 1.0 / length2[j]
+    for k in range(len(sx)):
+        best = np.inf
+        d2_prev = np.inf
+        t_prev = 0.0
+        falling = True
+        for j in range(len(dx)):
+            ex = sx[k] - px[j]
+            ey = sy[k] - py[j]
+            t = (ex*dx[j] + ey*dy[j]) * inv[j]
+            t = min(max(t, 0.0), 1.0)
+            ex -= t*dx[j]
+            ey -= t*dy[j]
+            d2 = ex*ex + ey*ey
+            best = min(best, d2)
+            # segment j - 1 was a local minimum
+            if j > 0 and falling and d2_prev <= d2 and d2_prev <= max_d2:
+                if n < len(cand_stop):
+                    cand_stop[n] = k
+                    cand_along[n] = cum[j - 1] + t_prev*(cum[j] - cum[j - 1])
+                    cand_dist[n] = np.sqrt(d2_prev)
+                n += 1
+            falling = d2 < d2_prev
+            d2_prev = d2
+            t_prev = t
+        j = len(dx)
+        if falling and d2_prev <= max_d2:
+            if n < len(cand_stop):
+                cand_stop[n] = k
+                cand_along[n] = cum[j - 1] + t_prev*(cum[j] - cum[j - 1])
+                cand_dist[n] = np.sqrt(d2_prev)
+            n += 1
+        nearest[k] = np.sqrt(best)
+    return n
+
+
+def _stop_candidates(
+    px, py, cum, sx, sy, max_offset,
+    use_numba: bool = True
+) -> tuple:
+    """Places each stop could sit on a shape. Shape points (px, py) and
+    stops (sx, sy) are planar meters. A candidate is a local minimum of
+    the stop's distance to the shape, no further than max_offset, so a
+    stop by both passes of an out-and-back shape gets one per pass.
+    Returns candidates CSR style by stop (offsets, along, dist) and
+    each stop's nearest distance to the shape"""
+    if len(px) == 1:
+        px, py, cum = np.repeat(px, 2), np.repeat(py, 2), np.repeat(cum, 2)
+    if use_numba and HAS_NUMBA:
+        size = 4*len(sx)
+        while True:
+            stop = np.empty(size, dtype=np.int64)
+            along = np.empty(size)
+            dist = np.empty(size)
+            nearest = np.empty(len(sx))
+            n = compiled(_candidate_loop)(
+                px, py, cum, sx, sy, max_offset, stop, along, dist, nearest
+            )
+            if n <= size:
+                break
+            size = n
+        stop, along, dist = stop[:n], along[:n], dist[:n]
+    else:
+        dx = np.diff(px)
+        dy = np.diff(py)
+        length2 = dx*dx + dy*dy
+        inv = np.divide(1.0, length2, out=np.zeros_like(length2), where=length2 > 0)
+        # stops x segments
+        ex = sx[:, None] - px[:-1]
+        ey = sy[:, None] - py[:-1]
+        t = ex*dx
+        t += ey*dy
+        t *= inv
+        np.clip(t, 0, 1, out=t)
+        ex -= t*dx
+        ey -= t*dy
+        d2 = ex*ex
+        d2 += ey*ey
+        # strictly below the previous segment and no higher than the next,
+        # so a stop on a shared vertex is one candidate, not two
+        local_min = np.ones(d2.shape, dtype=bool)
+        np.less(d2[:, 1:], d2[:, :-1], out=local_min[:, 1:])
+        local_min[:, :-1] &= d2[:, :-1] <= d2[:, 1:]
+        local_min &= d2 <= max_offset*max_offset
+        stop, seg = np.nonzero(local_min)
+        along = cum[seg] + t[stop, seg]*(cum[seg + 1] - cum[seg])
+        dist = np.sqrt(d2[stop, seg])
+        nearest = np.sqrt(d2.min(axis=1))
+    offsets = np.zeros(len(sx) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(stop, minlength=len(sx)), out=offsets[1:])
+    return offsets, along, dist, nearest
+
+
+def _match_stops(
+    cand_offsets, cand_along, cand_dist, max_backtrack, out, offset
+):
+    """Pick one candidate per stop so distance along the shape never
+    goes down, with the smallest total distance from the shape. A
+    candidate up to max_backtrack behind the stop before is still
+    allowed and placed level with it. out and offset are filled in
+    place and left alone for stops with no usable candidate"""
+    m = len(cand_along)
+    cost = np.full(m, np.inf)
+    pos = np.zeros(m)
+    back = np.full(m, -1)
+    cand_stop = np.zeros(m, dtype=np.int64)
+    # candidates of the last stop that could be matched
+    prev_lo = -1
+    prev_hi = -1
+    for k in range(len(cand_offsets) - 1):
+        lo = cand_offsets[k]
+        hi = cand_offsets[k + 1]
+        matched = False
+        for c in range(lo, hi):
+            cand_stop[c] = k
+            if prev_lo < 0:
+                cost[c] = cand_dist[c]
+                pos[c] = cand_along[c]
+                matched = True
+                continue
+            for p in range(prev_lo, prev_hi):
+                if cost[p] == np.inf or cand_along[c] < pos[p] - max_backtrack:
+                    continue
+                total = cost[p] + cand_dist[c]
+                at = max(cand_along[c], pos[p])
+                if total < cost[c] or (total == cost[c] and at < pos[c]):
+                    cost[c] = total
+                    pos[c] = at
+                    back[c] = p
+            if cost[c] < np.inf:
+                matched = True
+        if matched:
+            prev_lo = lo
+            prev_hi = hi
+    if prev_lo < 0:
+        return
+    c = prev_lo
+    for p in range(prev_lo, prev_hi):
+        if cost[p] < cost[c]:
+            c = p
+    while c >= 0:
+        out[cand_stop[c]] = pos[c]
+        offset[cand_stop[c]] = cand_dist[c]
+        c = back[c]
+
+
+def _project_stops(
+    px, py, cum, sx, sy,
+    max_offset: float = 100,
+    max_backtrack: float = 50,
+    use_numba: bool = True
+) -> tuple:
+    """Distance along a shape for each stop of one pattern, in stop
+    order, and each stop's distance from the shape. Stops more than
+    max_offset from the shape, or that can't be placed in order with
+    the rest, get a NaN distance"""
+    offsets, along, dist, nearest = _stop_candidates(
+        px, py, cum, sx, sy, float(max_offset), use_numba
+    )
+    out = np.full(len(sx), np.nan)
+    offset = nearest.copy()
+    compiled(_match_stops, use_numba)(
+        offsets, along, dist, float(max_backtrack), out, offset
+    )
+    return out, offset
+
+
+class ShapeGeometry(object):
+    """Cumulative distance along every shape in a feed, and stops
+    projected onto the shape of each trip"""
+
+    def __init__(
+        self,
+        gtfs,
+        max_offset: float = 100,
+        max_backtrack: float = 50,
+        use_numba: bool = True
+    ) -> None:
+        if gtfs.shapes.empty:
+            raise ValueError("Feed has no shapes.txt")
+        self.gtfs = gtfs
+        self.max_offset = max_offset
+        self.max_backtrack = max_backtrack
+        self.use_numba = use_numba
+        self._build_shapes()
+
+    def _build_shapes(self):
+        """cumulative haversine distance (meters) along each shape, plus
+        planar x/y around each shape's first point for projection"""
+        sh = self.gtfs.shapes.sort_values(
+            by=["shape_id","shape_pt_sequence"]
+        )
+        lat = sh["shape_pt_lat"].to_numpy(dtype=np.float64)
+        lon = sh["shape_pt_lon"].to_numpy(dtype=np.float64)
+        offsets = group_offsets(sh["shape_id"].to_numpy())
+        counts = np.diff(offsets)
+
+        step = np.zeros(len(sh))
+        step[1:] = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        step[offsets[:-1]] = 0
+        cum = np.cumsum(step)
+        cum -= np.repeat(cum[offsets[:-1]], counts)
+
+        self.shape_ids = sh["shape_id"].to_numpy()[offsets[:-1]]
+        self.shape_index = pd.Index(self.shape_ids)
+        self.lat0 = lat[offsets[:-1]]
+        self.lon0 = lon[offsets[:-1]]
+        self.x, self.y = self._planar(
+            lat, lon, np.repeat(self.lat0, counts), np.repeat(self.lon0, counts)
+        )
+        self.cum = cum
+        self.offsets = offsets
+
+    @staticmethod
+    def _planar(
+        lat, lon, lat0, lon0
+    ) -> tuple:
+        """equirectangular x/y in meters around (lat0, lon0)"""
+        x = EARTH_RADIUS_M * np.radians(lon - lon0) * np.cos(np.radians(lat0))
+        y = EARTH_RADIUS_M * np.radians(lat - lat0)
+        return x, y
+
+    def shape_lengths(
+        self
+    ) -> pd.DataFrame:
+        """Total length of each shape in miles"""
+        return pd.DataFrame(
+            {
+                "shape_id": self.shape_ids,
+                "length": self.cum[self.offsets[1:] - 1] / METERS_PER_MILE
+            }
+        )
+
+    def stop_distances(
+        self
+    ) -> pd.DataFrame:
+        """stop_times for every trip with a shape, sorted by trip and
+        stop_sequence, with distance (miles) of each stop along the shape
+        and offset (meters) from it. distance is NaN for stops more than
+        max_offset from their shape or out of order along it. Stops are
+        projected once per shape/stop pattern, not once per trip"""
+        start = time.perf_counter()
+        df = self.gtfs.stop_times[
+            ["trip_id","arrival_time","departure_time","stop_id","stop_sequence"]
+        ].merge(
+            self.gtfs.trips[["trip_id","route_id","direction_id","service_id","shape_id"]],
+            on="trip_id"
+        )
+        df = df[df["shape_id"].isin(self.shape_index)]
+        df = df.merge(
+            self.gtfs.stops[["stop_id","stop_lat","stop_lon"]],
+            on="stop_id"
+        )
+        df = df.sort_values(by=["trip_id","stop_sequence"], ignore_index=True)
+        if df.empty:
+            logging.warning("No trips have a shape_id found in shapes.txt")
+            return df.assign(distance=np.zeros(0), offset=np.zeros(0))
+        offsets = group_offsets(df["trip_id"].to_numpy())
+
+        # trips that share a shape and stop list share a projection
+        patterns = df.groupby("trip_id", sort=True)["stop_id"].agg(tuple)
+        keys = list(zip(df["shape_id"].to_numpy()[offsets[:-1]], patterns))
+        codes, uniques = pd.factorize(pd.Series(keys))
+        first_trip = np.unique(codes, return_index=True)[1]
+
+        lat = df["stop_lat"].to_numpy(dtype=np.float64)
+        lon = df["stop_lon"].to_numpy(dtype=np.float64)
+        pattern_dist, pattern_offset = [], []
+        for t in first_trip:
+            rows = slice(offsets[t], offsets[t + 1])
+            s = self.shape_index.get_loc(df["shape_id"].iat[offsets[t]])
+            pts = slice(self.offsets[s], self.offsets[s + 1])
+            sx, sy = self._planar(lat[rows], lon[rows], self.lat0[s], self.lon0[s])
+            out, offset = _project_stops(
+                self.x[pts], self.y[pts], self.cum[pts], sx, sy,
+                self.max_offset, self.max_backtrack, self.use_numba
+            )
+            pattern_dist.append(out)
+            pattern_offset.append(offset)
+
+        df["distance"] = np.concatenate(
+            [pattern_dist[c] for c in codes]
+        ) / METERS_PER_MILE
+        df["offset"] = np.concatenate([pattern_offset[c] for c in codes])
+        unprojected = df["distance"].isna()
+        if unprojected.any():
+            logging.warning(
+                f"{df.loc[unprojected, 'stop_id'].nunique()} stops are more than "
+                f"{self.max_offset} m from their shape or out of order along it "
+                f"and were not projected"
+            )
+        logging.debug(
+            f"Projected {len(uniques)} stop patterns for {len(codes)} trips "
+            f"in {time.perf_counter() - start:.2f} s"
+        )
+        return df
+
+    def segments(
+        self
+    ) -> pd.DataFrame:
+        """Distance (miles), scheduled time (minutes) and speed (mph)
+        from the previous stop, for every stop of every trip. The first
+        stop of each trip is NaN"""
+        df = self.stop_distances()
+        offsets = group_offsets(df["trip_id"].to_numpy())
+        arrival = time_to_seconds(df["arrival_time"]) / 3600
+        departure = time_to_seconds(df["departure_time"]) / 3600
+
+        df["prior_stop_id"] = df["stop_id"].shift(1)
+        df.loc[offsets[:-1], "prior_stop_id"] = np.nan
+        df["segment_distance"] = grouped_diff(df["distance"].to_numpy(), offsets)
+        df["segment_time"] = (arrival - grouped_shift(departure, offsets)) * 60
+        # zero scheduled time between timepoints has no meaningful speed
+        with np.errstate(divide="ignore", invalid="ignore"):
+            df["segment_speed"] = np.where(
+                df["segment_time"] > 0,
+                df["segment_distance"] / (df["segment_time"] / 60),
+                np.nan
+            )
+        return df
+
+    def slow_segments(
+        self,
+        max_speed: float = 8
+    ) -> pd.DataFrame:
+        """Stop to stop segments per route/direction/service whose median
+        scheduled speed is under max_speed mph. Segments touching an
+        unprojected stop, or with no distance between the two stops (which
+        means the projection couldn't separate them), are left out"""
+        df = self.segments().dropna(subset=["segment_speed"])
+        df = df[df["segment_distance"] > 0]
+        df["prior_stop_id"] = df["prior_stop_id"].astype(df["stop_id"].dtype)
+        gf = df.groupby(
+            by=["route_id","direction_id","service_id","prior_stop_id","stop_id"],
+            as_index=False
+        ).agg(
+            {
+                "segment_distance":"median",
+                "segment_time":"median",
+                "segment_speed":("median","min","count")
+            }
+        )
+        gf.columns = [
+            "route_id","direction_id","service_id","prior_stop_id","stop_id",
+            "segment_distance","segment_time","median_speed","min_speed","trips"
+        ]
+        return gf[gf["median_speed"] < max_speed].sort_values(
+            by="median_speed", ignore_index=True
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=10)
+    from gtfs import GTFS
+    start = time.perf_counter()
+    print(ShapeGeometry(GTFS()).slow_segments())
+    logging.info(f"Done in {time.perf_counter() - start:.2f} s")
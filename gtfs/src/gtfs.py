@@ -12,6 +12,9 @@ from zipfile import ZipFile
 import pandas as pd
 import numpy as np
 
+from kernels import group_offsets, grouped_diff, grouped_shift
+from geometry import ShapeGeometry
+
 DATA_PATH = os.path.join(
     os.path.dirname(
         os.path.dirname(
@@ -93,6 +96,15 @@ class GTFS(object):
         df["arrival_time_num"] = df["arrival_time"].astype(str).apply(
             lambda x: int(x.split(":")[0]) + float(x.split(":")[1])/60 + float(x.split(":")[2])/3600
         )
+        if "shape_dist_traveled" not in df.columns:
+            # optional in gtfs, measure along the shapes instead (in feet, like trimet)
+            sf = ShapeGeometry(self).stop_distances()
+            df = df.merge(
+                sf[["trip_id","stop_sequence","distance"]],
+                on=["trip_id","stop_sequence"],
+                how="left"
+            )
+            df["shape_dist_traveled"] = df["distance"] * 5280
         gf = df.groupby(
             by=["trip_id"],
             as_index=False
@@ -138,15 +150,12 @@ class GTFS(object):
             by=["route_id","direction_id","stop_id","service_id","departure_time_num"],
             inplace=True
         )
-        df["prior_departure_time_num"] = df["departure_time_num"].shift(1)
-        df["prior_departure_time_num"] = np.where(
-            (df["route_id"].shift(1) == df["route_id"])
-            & (df["stop_id"].shift(1) == df["stop_id"])
-            & (df["service_id"].shift(1) == df["service_id"]),
-            df["prior_departure_time_num"],
-            np.nan
+        offsets = group_offsets(
+            df["route_id"].to_numpy(),
+            df["stop_id"].to_numpy(),
+            df["service_id"].to_numpy()
         )
-        df["headway"] = df["departure_time_num"] - df["prior_departure_time_num"]
+        df["headway"] = grouped_diff(df["departure_time_num"].to_numpy(), offsets)
         # define a "day" thing
         df["during_day"] = np.where(
             (df["departure_time_num"] > 7)
@@ -249,30 +258,27 @@ class GTFS(object):
             by=["route_id","direction_id","stop_id","service_id","departure_time"],
             inplace=True
         )
-        df["prior_trip_departure_time"] = df["departure_time"].shift(1)
-        df["prior_trip_departure_time"] = np.where(
-            (df["route_id"].shift(1) == df["route_id"])
-            & (df["stop_id"].shift(1) == df["stop_id"])
-            & (df["service_id"].shift(1) == df["service_id"]),
-            df["prior_trip_departure_time"],
-            np.nan
+        offsets = group_offsets(
+            df["route_id"].to_numpy(),
+            df["stop_id"].to_numpy(),
+            df["service_id"].to_numpy()
         )
-        df["headway"] = df["departure_time"] - df["prior_trip_departure_time"]
+        df["headway"] = grouped_diff(df["departure_time"].to_numpy(), offsets)
 
         # sort, get travel time between all stops
         df.sort_values(
             by=["route_id","direction_id","service_id","trip_id","stop_sequence"],
             inplace=True
         )
-        df["prior_departure_time"] = df["departure_time"].shift(1)
-        df["prior_departure_time"] = np.where(
-            (df["route_id"].shift(1) == df["route_id"])
-            & (df["direction_id"].shift(1) == df["direction_id"])
-            & (df["service_id"].shift(1) == df["service_id"]),
-            df["prior_departure_time"],
-            np.nan
+        # trip_id has to be part of the group, otherwise the last stop
+        # of one trip gets linked to the first stop of the next
+        offsets = group_offsets(
+            df["route_id"].to_numpy(),
+            df["direction_id"].to_numpy(),
+            df["service_id"].to_numpy(),
+            df["trip_id"].to_numpy()
         )
-        df["travel_time"] = df["departure_time"] - df["prior_departure_time"]
+        df["travel_time"] = grouped_diff(df["departure_time"].to_numpy(), offsets)
 
     
         # loop over route/directions/service, find o/d pairs
@@ -364,9 +370,15 @@ class GTFS(object):
             "trip_start_time","trip_end_time"
         ]
         # add shape dist traveled max
-        sf = self.shapes.groupby(
-            by="shape_id"
-        )[["shape_dist_traveled"]].max()
+        if "shape_dist_traveled" in self.shapes.columns:
+            sf = self.shapes.groupby(
+                by="shape_id"
+            )[["shape_dist_traveled"]].max()
+        else:
+            # optional in gtfs, measure the shapes instead (in feet, like trimet)
+            sf = ShapeGeometry(self).shape_lengths()
+            sf["shape_dist_traveled"] = sf["length"] * 5280
+            sf = sf.set_index("shape_id")[["shape_dist_traveled"]]
         df = df.merge(
             sf,
             on="shape_id"
@@ -384,14 +396,12 @@ class GTFS(object):
             ],
             inplace=True
         )
-        df["prior_trip_start_time"] = df["trip_start_time"].shift(1)
-        df["prior_trip_start_time"] = np.where(
-            (df["route_id"].shift(1) == df["route_id"])
-            & (df["direction_id"].shift(1) == df["direction_id"])
-            & (df["service_id"].shift(1) == df["service_id"]),
-            df["prior_trip_start_time"],
-            np.nan
+        offsets = group_offsets(
+            df["route_id"].to_numpy(),
+            df["direction_id"].to_numpy(),
+            df["service_id"].to_numpy()
         )
+        df["prior_trip_start_time"] = grouped_shift(df["trip_start_time"].to_numpy(), offsets)
         df["headway"] = df["trip_start_time"] - df["prior_trip_start_time"]
         
         """# i still can't think of a better way than a loop
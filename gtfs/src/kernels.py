@@ -0,0 +1,256 @@
+"""
+    Date: 2026-10-19
+    Author: Andrew Lindstrom
+    Purpose:
+        Grouped shift/diff kernels for headway and travel time passes,
+        plus small numeric helpers shared by the other modules.
+        Uses numba when it is installed, plain numpy otherwise
+"""
+import os
+import time
+import logging
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+# numba is slow to import, so only check that it exists here and
+# compile the kernels the first time they are needed
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+_COMPILED = {}
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def compiled(
+    fn,
+    use_numba: bool = True
+):
+    """numba compiled version of a plain python kernel, built once on
+    first use, or the function itself when numba isn't available"""
+    if not (use_numba and HAS_NUMBA):
+        return fn
+    if fn not in _COMPILED:
+        from numba import njit
+        _COMPILED[fn] = njit(cache=True)(fn)
+    return _COMPILED[fn]
+
+
+def haversine(
+    lat1,
+    lon1,
+    lat2,
+    lon2
+) -> np.ndarray:
+    """Great circle distance in meters, vectorized over numpy arrays"""
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2)**2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _parse_time_chars(
+    chars: np.ndarray
+) -> np.ndarray:
+    """time_to_seconds for any [H]H:[M]M:[S]S layout. chars is the
+    (rows, width) code point array of the strings, null padded. The
+    python loop runs over the width, not the rows"""
+    n = len(chars)
+    acc = np.zeros(n, dtype=np.int64)
+    val = np.zeros(n, dtype=np.int64)
+    n_digits = np.zeros(n, dtype=np.int64)
+    colons = np.zeros(n, dtype=np.int64)
+    ok = np.ones(n, dtype=bool)
+    started = np.zeros(n, dtype=bool)
+    trailing = np.zeros(n, dtype=bool)
+    for c in chars.T:
+        digit = (c >= ord("0")) & (c <= ord("9"))
+        colon = c == ord(":")
+        space = (c == ord(" ")) | (c == ord("\t"))
+        ok &= digit | colon | space | (c == 0)
+        # whitespace is only allowed around the time, not inside it
+        ok &= ~((digit | colon) & trailing)
+        trailing |= space & started
+        started |= digit | colon
+        # a colon closes a field, which needs at least one digit
+        ok &= ~(colon & (n_digits == 0))
+        acc = np.where(colon, (acc + val)*60, acc)
+        val = np.where(colon, 0, val)
+        n_digits = np.where(colon, 0, n_digits)
+        val = np.where(digit, val*10 + (c.astype(np.int64) - ord("0")), val)
+        n_digits += digit
+        colons += colon
+    ok &= (colons == 2) & (n_digits > 0)
+    return np.where(ok, acc + val, np.nan)
+
+
+def time_to_seconds(
+    times
+) -> np.ndarray:
+    """GTFS 'HH:MM:SS' times (hours can run past 24) to seconds after
+    midnight, vectorized over a column or list. Missing or malformed
+    times come back as NaN"""
+    values = pd.Series(times, dtype=object).to_numpy()
+    out = np.full(len(values), np.nan)
+    if len(values) == 0:
+        return out
+    # missing values become 'nan'/'None' here and fail both parses
+    chars = values.astype(str)
+    chars = chars.view(np.uint32).reshape(len(chars), -1)
+
+    # zero padded HH:MM:SS is nearly every row, read it from fixed columns
+    fast = np.zeros(len(chars), dtype=bool)
+    if chars.shape[1] >= 8:
+        # non digits wrap around to large values
+        d = chars[:, :8] - np.uint32(ord("0"))
+        fast = (
+            (d[:, [0, 1, 3, 4, 6, 7]] <= 9).all(axis=1)
+            & (chars[:, 2] == ord(":")) & (chars[:, 5] == ord(":"))
+        )
+        if chars.shape[1] > 8:
+            fast &= chars[:, 8] == 0
+        out[fast] = d[fast] @ np.array([36000, 3600, 0, 600, 60, 0, 10, 1], dtype=np.int64)
+    if not fast.all():
+        out[~fast] = _parse_time_chars(chars[~fast])
+    return out
+
+
+def group_offsets(
+    *keys
+) -> np.ndarray:
+    """Start offsets of each run of equal keys in already sorted data,
+    with the total length appended as the last element, so group g
+    spans offsets[g]:offsets[g+1]"""
+    n = len(keys[0])
+    if n == 0:
+        return np.zeros(1, dtype=np.int64)
+    change = np.zeros(n, dtype=bool)
+    change[0] = True
+    for key in keys:
+        key = np.asarray(key)
+        # NaN != NaN, so missing keys start a new group, same as the
+        # old shift(1) == comparison did
+        change[1:] |= key[1:] != key[:-1]
+    return np.append(np.flatnonzero(change), n).astype(np.int64)
+
+
+def _grouped_shift_loop(values, offsets, out):
+    """grouped_shift kernel, run through compiled()"""
+    for g in range(len(offsets) - 1):
+        start = offsets[g]
+        out[start] = np.nan
+        for i in range(start + 1, offsets[g + 1]):
+            out[i] = values[i - 1]
+
+
+def _grouped_diff_loop(values, offsets, out):
+    """grouped_diff kernel, run through compiled()"""
+    for g in range(len(offsets) - 1):
+        start = offsets[g]
+        out[start] = np.nan
+        for i in range(start + 1, offsets[g + 1]):
+            out[i] = values[i] - values[i - 1]
+
+
+def grouped_shift(
+    values,
+    offsets: np.ndarray,
+    use_numba: bool = True
+) -> np.ndarray:
+    """Previous value within the same group, NaN on the first row of a group"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.empty(len(values), dtype=np.float64)
+    if len(values) == 0:
+        return out
+    if use_numba and HAS_NUMBA:
+        compiled(_grouped_shift_loop)(values, offsets, out)
+        return out
+    out[1:] = values[:-1]
+    out[offsets[:-1]] = np.nan
+    return out
+
+
+def grouped_diff(
+    values,
+    offsets: np.ndarray,
+    use_numba: bool = True
+) -> np.ndarray:
+    """Difference from the previous value within the same group,
+    NaN on the first row of a group"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.empty(len(values), dtype=np.float64)
+    if len(values) == 0:
+        return out
+    if use_numba and HAS_NUMBA:
+        compiled(_grouped_diff_loop)(values, offsets, out)
+        return out
+    np.subtract(values[1:], values[:-1], out=out[1:])
+    out[offsets[:-1]] = np.nan
+    return out
+
+
+def _pandas_grouped_diff(df, keys, col):
+    """the original shift-and-compare approach, kept for benchmarking"""
+    mask = np.ones(len(df), dtype=bool)
+    for key in keys:
+        mask &= (df[key].shift(1) == df[key]).to_numpy()
+    prior = np.where(mask, df[col].shift(1), np.nan)
+    return df[col].to_numpy() - prior
+
+
+def benchmark(
+    gtfs,
+    repeat: int = 5
+) -> dict:
+    """Time the pandas shift-and-compare headway pass against the
+    kernel backends on a feed's stop_times"""
+    df = gtfs.stop_times[["trip_id","stop_id","departure_time"]].merge(
+        gtfs.trips[["trip_id","route_id","direction_id","service_id"]],
+        on="trip_id"
+    )
+    df["departure_time"] = time_to_seconds(df["departure_time"]) / 3600
+    df.sort_values(
+        by=["route_id","direction_id","stop_id","service_id","departure_time"],
+        inplace=True
+    )
+    keys = ["route_id","stop_id","service_id"]
+
+    def _pandas():
+        return _pandas_grouped_diff(df, keys, "departure_time")
+
+    def _kernel(use_numba):
+        offsets = group_offsets(*[df[k].to_numpy() for k in keys])
+        return grouped_diff(df["departure_time"].to_numpy(), offsets, use_numba=use_numba)
+
+    runs = {
+        "pandas": _pandas,
+        "numpy": lambda: _kernel(False),
+    }
+    if HAS_NUMBA:
+        # warm up so compile time isn't counted
+        _kernel(True)
+        runs["numba"] = lambda: _kernel(True)
+
+    expected = _pandas()
+    res = {}
+    for name, fn in runs.items():
+        if not np.allclose(fn(), expected, equal_nan=True):
+            raise ValueError(f"{name} headways do not match the pandas path")
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        res[name] = min(times)
+        logging.info(f"{name}: {res[name]*1000:.1f} ms over {len(df)} rows")
+    return res
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=20)
+    from gtfs import GTFS, DATA_PATH
+    print(benchmark(GTFS(os.path.join(DATA_PATH, "trimet_gtfs_2023_01_11.zip"))))
@@ -8,8 +8,10 @@ import os
 import re
 import logging
 
-import PyPDF2
+from array import array
+
 import pandas as pd
+import numpy as np
 
 DATA_PATH = os.path.join(
     os.path.dirname(
@@ -27,11 +29,31 @@ OUTPUT_PATH = os.path.join(
     ),
     "output"
 )
+REJECTS_PATH = os.path.join(
+    DATA_PATH,
+    "stop_level_ridership_rejects.csv"
+)
+
+# one table row, e.g.
+# "W Burnside & SW 6th 792 E NS 784 476 1,260 | 285"
+# direction is blank for some rail stations
+_COUNT = r"\d{1,3}(?:,\d{3})*"
+LINE_PATTERN = re.compile(
+    rf"^(?P<stop_name>.*\S)\s+(?P<stop_id>\d+)\s+(?:(?P<direction>[NSEW])\s+)?"
+    rf"(?P<position>NS|FS|AT|OP)\s+(?P<ons>{_COUNT})\s+(?P<offs>{_COUNT})\s+"
+    rf"(?P<total_boardings>{_COUNT})\s*\|\s*(?P<monthly_lifts>{_COUNT})\s*$"
+)
+STRICT_COLS = [
+    "stop_id","ons","offs",
+    "total_boardings","monthly_lifts"
+]
 
 def parse_data(
     file_path
 ) -> pd.DataFrame:
     """Parse all table data out of input pdf"""
+    # PyPDF2 is only needed when the pdfs are actually parsed
+    import PyPDF2
     pdf = PyPDF2.PdfReader(file_path)
     cols = [
         "monthly_lifts","total_boardings",
@@ -58,23 +80,132 @@ def parse_data(
     return df
 
 
-def main():
+def parse_line(
+    line: str,
+    pattern: re.Pattern = LINE_PATTERN
+) -> tuple:
+    """One table line to (row, None) with row in STRICT_COLS order,
+    or (None, reason) when the line is rejected"""
+    m = pattern.match(line)
+    if not m:
+        return None, "no match"
+    row = [int(m[c].replace(",", "")) for c in STRICT_COLS]
+    if row[1] + row[2] != row[3]:
+        return None, "ons + offs != total"
+    return row, None
+
+
+def parse_data_strict(
+    file_path,
+    pages: list = None,
+    pattern: re.Pattern = LINE_PATTERN
+) -> tuple:
+    """Parse table data out of input pdf, validating every row.
+    Lines that don't match pattern, or where ons + offs != total,
+    are returned in a second frame with their 1-based page number
+    instead of being kept. pages limits parsing to those page numbers"""
+    import PyPDF2
+    pdf = PyPDF2.PdfReader(file_path)
+    if pages is None:
+        pages = range(1, len(pdf.pages) + 1)
+    data = {c: array("q") for c in STRICT_COLS}
+    rejects = []
+    for page_number in pages:
+        text = pdf.pages[int(page_number) - 1].extract_text()
+        for line in text.split('\n'):
+            if "|" not in line:
+                continue
+            row, reason = parse_line(line, pattern)
+            if reason:
+                rejects.append((page_number, line, reason))
+                continue
+            for c, v in zip(STRICT_COLS, row):
+                data[c].append(v)
+    df = pd.DataFrame({c: np.frombuffer(data[c], dtype=np.int64) for c in STRICT_COLS})
+    rf = pd.DataFrame(rejects, columns=["page","line","reason"])
+    rf.insert(0, "file", os.path.basename(file_path))
+    if not rf.empty:
+        logging.warning(
+            f"Rejected {len(rf)} lines on pages {sorted(rf['page'].unique().tolist())} of {rf['file'][0]}"
+        )
+    return df, rf
+
+
+def _file_date(
+    file_path
+) -> pd.Timestamp:
+    """census date from the pdf file name"""
+    return pd.to_datetime(
+        os.path.basename(file_path).split(".")[0][-10:],
+        format="%Y_%m_%d"
+    )
+
+
+def reparse_rejects(
+    report_path: os.PathLike = REJECTS_PATH,
+    pattern: re.Pattern = LINE_PATTERN
+) -> pd.DataFrame:
+    """Re-parse only the pages listed in the rejects report and add any
+    recovered rows to stop_level_ridership_data.csv. The report is
+    rewritten with the lines it listed that are still rejected.
+    Parsing is deterministic, so this only recovers rows after
+    LINE_PATTERN has been fixed or with an override pattern for the
+    odd lines. Nothing is written when no rows are recovered"""
+    report = pd.read_csv(report_path)
+    if report.empty:
+        return report
+    data_path = os.path.join(DATA_PATH, "stop_level_ridership_data.csv")
+    data, rejects = [], []
+    for fname, rf in report.groupby("file"):
+        file_path = os.path.join(DATA_PATH, fname)
+        df, rf = parse_data_strict(
+            file_path, pages=sorted(rf["page"].unique()), pattern=pattern
+        )
+        df["date"] = _file_date(file_path)
+        data.append(df)
+        rejects.append(rf)
+    # an override pattern can reject lines the data already has, only
+    # lines from the report count as still rejected
+    rf = pd.concat(rejects).merge(
+        report[["file","page","line"]].drop_duplicates(),
+        on=["file","page","line"]
+    )
+
+    stop_data = pd.read_csv(data_path, parse_dates=["date"])
+    df = pd.concat(data).drop_duplicates(subset=["stop_id","date"])
+    known = pd.MultiIndex.from_frame(stop_data[["stop_id","date"]])
+    df = df[~pd.MultiIndex.from_frame(df[["stop_id","date"]]).isin(known)]
+    if df.empty:
+        logging.info("No rejected lines recovered, data left unchanged")
+        return rf
+    logging.info(f"Recovered {len(df)} rows, {len(rf)} lines still rejected")
+    pd.concat([stop_data, df]).to_csv(data_path, index=False)
+    rf.to_csv(report_path, index=False)
+    return rf
+
+
+def main(
+    strict: bool = True
+):
     """Process driver"""
 
     list_of_pdfs = [
         os.path.join(DATA_PATH, f) for f in os.listdir(DATA_PATH) if f.endswith(".pdf")
     ]
     data = []
+    rejects = []
     for file_path in list_of_pdfs:
-        fname = os.path.basename(file_path)
-        date = pd.to_datetime(
-            fname.split(".")[0][-10:],
-            format="%Y_%m_%d"
-        )
-        df = parse_data(file_path=file_path)
+        date = _file_date(file_path)
+        if strict:
+            df, rf = parse_data_strict(file_path=file_path)
+            rejects.append(rf)
+        else:
+            df = parse_data(file_path=file_path)
         df["date"] = date
         data.append(df)
 
+    if strict:
+        pd.concat(rejects).to_csv(REJECTS_PATH, index=False)
     df = pd.concat(data)
     df.to_csv(
         os.path.join(
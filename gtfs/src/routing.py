@@ -0,0 +1,281 @@
+"""
+    Date: 2026-10-19
+    Author: Andrew Lindstrom
+    Purpose:
+        Stop to stop reachability with transfers, using the connection
+        scan algorithm over a feed's stop_times/trips/stops
+"""
+import time
+import logging
+
+import pandas as pd
+import numpy as np
+
+from kernels import compiled, group_offsets, haversine, time_to_seconds
+
+INF = np.iinfo(np.int64).max // 4
+
+
+def _to_seconds(
+    t
+) -> int:
+    """seconds after midnight from 'HH:MM:SS' or hours as a float"""
+    if isinstance(t, str):
+        seconds = time_to_seconds([t])[0]
+        if np.isnan(seconds):
+            raise ValueError(f"Can't read time {t!r}, expected HH:MM:SS")
+        return int(seconds)
+    return int(round(float(t) * 3600))
+
+
+def _csa_scan(
+    conn_dep, conn_arr, conn_from, conn_to, conn_trip, start, end,
+    foot_offsets, foot_to, foot_secs, min_transfer,
+    arr, ready, ride, trip_reached
+):
+    """Earliest arrival scan over connections sorted by departure.
+    arr holds arrival times, ready the time a stop can be boarded from
+    (arrival plus the transfer allowance) and ride the earliest arrival
+    on a vehicle, all filled in place. Footpaths aren't transitive, so
+    they are walked from every improved vehicle arrival, not only from
+    improved arr"""
+    for c in range(start, end):
+        t = conn_trip[c]
+        if trip_reached[t] or ready[conn_from[c]] <= conn_dep[c]:
+            trip_reached[t] = True
+            s = conn_to[c]
+            a = conn_arr[c]
+            if a < ride[s]:
+                ride[s] = a
+                if a < arr[s]:
+                    arr[s] = a
+                if a + min_transfer < ready[s]:
+                    ready[s] = a + min_transfer
+                for k in range(foot_offsets[s], foot_offsets[s + 1]):
+                    s2 = foot_to[k]
+                    a2 = a + foot_secs[k]
+                    if a2 < arr[s2]:
+                        arr[s2] = a2
+                    if a2 + min_transfer < ready[s2]:
+                        ready[s2] = a2 + min_transfer
+
+
+class ConnectionScan(object):
+    """Earliest arrival routing on one service day of a GTFS feed.
+    Transfers are allowed at the same stop and by walking between stops
+    within max_walk meters of each other"""
+
+    def __init__(
+        self,
+        gtfs,
+        date = None,
+        service_ids = None,
+        max_walk: float = 250,
+        walk_speed: float = 1.3,
+        min_transfer: int = 60,
+        use_numba: bool = True
+    ) -> None:
+        self.gtfs = gtfs
+        self.min_transfer = int(min_transfer)
+        self.use_numba = use_numba
+        if service_ids is None:
+            service_ids = self._service_ids_for(date)
+        self.service_ids = set(service_ids)
+
+        self.stops = gtfs.stops.reset_index(drop=True)
+        self.stop_index = pd.Index(self.stops["stop_id"])
+        self._build_connections()
+        self._build_footpaths(max_walk, walk_speed)
+
+    def _service_ids_for(
+        self,
+        date = None
+    ) -> list:
+        """service ids running on a date, defaulting to the earliest
+        tuesday-friday with service in calendar_dates. Unlike
+        GTFS.summary this is one date for all service types, so the
+        connections are a single real day of service"""
+        cf = self.gtfs.calendar_dates
+        dates = cf["date"]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates.astype(str), format="%Y%m%d")
+        active = np.ones(len(cf), dtype=bool)
+        if "exception_type" in cf.columns:
+            active = (cf["exception_type"] == 1).to_numpy()
+        if date is None:
+            weekdays = dates[active & dates.dt.weekday.isin({1,2,3,4}).to_numpy()]
+            if weekdays.empty:
+                raise ValueError("No weekday service found in calendar_dates")
+            date = weekdays.min()
+        service_ids = cf["service_id"][active & (dates == pd.to_datetime(date)).to_numpy()]
+        if service_ids.empty:
+            raise ValueError(f"No service found on {date}")
+        logging.debug(f"Routing on {date} with service ids {sorted(service_ids.unique())}")
+        return list(service_ids.unique())
+
+    def _build_connections(self):
+        """one connection per consecutive pair of stops on a trip,
+        sorted by departure time"""
+        trips = self.gtfs.trips
+        trips = trips[trips["service_id"].isin(self.service_ids)]
+        self.trip_ids = trips["trip_id"].to_numpy()
+
+        df = self.gtfs.stop_times[
+            ["trip_id","arrival_time","departure_time","stop_id","stop_sequence"]
+        ]
+        df = df[df["trip_id"].isin(self.trip_ids)]
+        df = df.sort_values(by=["trip_id","stop_sequence"])
+        arrival = time_to_seconds(df["arrival_time"])
+        departure = time_to_seconds(df["departure_time"])
+        # missing or malformed times are NaN, which can't be cast to int
+        timed = ~(np.isnan(arrival) | np.isnan(departure))
+        if not timed.all():
+            logging.warning(f"Dropped {(~timed).sum()} stop_times without valid times")
+        df = df[timed]
+        arrival = arrival[timed].astype(np.int64)
+        departure = departure[timed].astype(np.int64)
+        trip = pd.Index(self.trip_ids).get_indexer(df["trip_id"])
+        stop = self.stop_index.get_indexer(df["stop_id"])
+
+        # a connection leaves from every row that isn't the last stop of its trip
+        offsets = group_offsets(trip)
+        last = np.zeros(len(df), dtype=bool)
+        last[offsets[1:] - 1] = True
+        idx = np.flatnonzero(~last)
+        idx = idx[(stop[idx] >= 0) & (stop[idx + 1] >= 0)]
+
+        order = np.argsort(departure[idx], kind="stable")
+        idx = idx[order]
+        self.conn_dep = departure[idx]
+        self.conn_arr = arrival[idx + 1]
+        self.conn_from = stop[idx].astype(np.int64)
+        self.conn_to = stop[idx + 1].astype(np.int64)
+        self.conn_trip = trip[idx].astype(np.int64)
+        logging.debug(
+            f"Built {len(idx)} connections over {len(self.trip_ids)} trips"
+        )
+
+    def _build_footpaths(
+        self,
+        max_walk: float,
+        walk_speed: float
+    ):
+        """walking links between stops within max_walk meters, stored
+        CSR style so stop s links to foot_to[foot_offsets[s]:foot_offsets[s+1]]"""
+        n = len(self.stops)
+        lat = self.stops["stop_lat"].to_numpy(dtype=np.float64)
+        lon = self.stops["stop_lon"].to_numpy(dtype=np.float64)
+        order = np.argsort(lat)
+        lat_sorted = lat[order]
+        # meters per degree of latitude
+        window = max_walk / 111195
+        lo = np.searchsorted(lat_sorted, lat - window, side="left")
+        hi = np.searchsorted(lat_sorted, lat + window, side="right")
+        src, dst, dist = [], [], []
+        if max_walk > 0:
+            for i in range(n):
+                cand = order[lo[i]:hi[i]]
+                cand = cand[cand != i]
+                d = haversine(lat[i], lon[i], lat[cand], lon[cand])
+                keep = d <= max_walk
+                src.append(np.full(keep.sum(), i))
+                dst.append(cand[keep])
+                dist.append(d[keep])
+        src = np.concatenate(src) if src else np.zeros(0, dtype=np.int64)
+        dst = np.concatenate(dst) if dst else np.zeros(0, dtype=np.int64)
+        dist = np.concatenate(dist) if dist else np.zeros(0)
+        order = np.argsort(src, kind="stable")
+        self.foot_to = dst[order].astype(np.int64)
+        self.foot_secs = np.ceil(dist[order] / walk_speed).astype(np.int64)
+        self.foot_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.foot_offsets[1:])
+        logging.debug(f"Built {len(self.foot_to)} footpaths")
+
+    def earliest_arrival(
+        self,
+        origin,
+        departure,
+        max_minutes: float = 90
+    ) -> np.ndarray:
+        """Earliest arrival time in seconds at every stop (INF if not
+        reachable within max_minutes), indexed like self.stops"""
+        o = self.stop_index.get_loc(origin)
+        dep = _to_seconds(departure)
+        n = len(self.stops)
+        arr = np.full(n, INF, dtype=np.int64)
+        ready = np.full(n, INF, dtype=np.int64)
+        ride = np.full(n, INF, dtype=np.int64)
+        arr[o] = ready[o] = dep
+        walk = slice(self.foot_offsets[o], self.foot_offsets[o + 1])
+        arr[self.foot_to[walk]] = ready[self.foot_to[walk]] = dep + self.foot_secs[walk]
+        trip_reached = np.zeros(len(self.trip_ids), dtype=np.bool_)
+
+        limit = dep + int(max_minutes * 60)
+        start = np.searchsorted(self.conn_dep, dep, side="left")
+        end = np.searchsorted(self.conn_dep, limit, side="right")
+        compiled(_csa_scan, self.use_numba)(
+            self.conn_dep, self.conn_arr, self.conn_from, self.conn_to, self.conn_trip,
+            start, end, self.foot_offsets, self.foot_to, self.foot_secs,
+            self.min_transfer, arr, ready, ride, trip_reached
+        )
+        arr[arr > limit] = INF
+        return arr
+
+    def reachable(
+        self,
+        origin,
+        departure,
+        max_minutes: float = 90
+    ) -> pd.DataFrame:
+        """Stops reachable from origin, with arrival time in hours and
+        travel time in minutes"""
+        start = time.perf_counter()
+        arr = self.earliest_arrival(origin, departure, max_minutes)
+        logging.debug(
+            f"Scanned from {origin} in {(time.perf_counter() - start)*1000:.1f} ms"
+        )
+        hit = np.flatnonzero(arr < INF)
+        df = self.stops.iloc[hit].reset_index(drop=True)
+        df.insert(0, "origin_stop_id", origin)
+        df["arrival_time"] = arr[hit] / 3600
+        df["travel_time"] = (arr[hit] - _to_seconds(departure)) / 60
+        return df.sort_values(by="travel_time", ignore_index=True)
+
+    def isochrones(
+        self,
+        origins,
+        departure,
+        max_minutes: float = 60
+    ) -> pd.DataFrame:
+        """Travel time in minutes from each origin to every stop reachable
+        within max_minutes, one row per origin/stop pair"""
+        dep = _to_seconds(departure)
+        start = time.perf_counter()
+        origin_col, stop_col, time_col = [], [], []
+        for origin in origins:
+            arr = self.earliest_arrival(origin, departure, max_minutes)
+            hit = np.flatnonzero(arr < INF)
+            origin_col.append(np.full(len(hit), origin, dtype=object))
+            stop_col.append(self.stop_index.to_numpy()[hit])
+            time_col.append((arr[hit] - dep) / 60)
+        logging.info(
+            f"Ran {len(origin_col)} origins in {time.perf_counter() - start:.2f} s"
+        )
+        if not origin_col:
+            return pd.DataFrame(columns=["origin_stop_id","stop_id","travel_time"])
+        return pd.DataFrame(
+            {
+                "origin_stop_id": np.concatenate(origin_col),
+                "stop_id": np.concatenate(stop_col),
+                "travel_time": np.concatenate(time_col)
+            }
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=10)
+    from gtfs import GTFS
+    cs = ConnectionScan(GTFS())
+    origins = cs.stops["stop_id"].to_numpy()[::50]
+    iso = cs.isochrones(origins, "08:00:00", max_minutes=45)
+    print(iso.groupby("origin_stop_id")["stop_id"].count().describe())
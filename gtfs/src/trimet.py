@@ -5,11 +5,7 @@
         TriMet specfic GTFS parser
 """
 import os
-
 import logging
-logging.basicConfig(
-    level=10
-)
 
 import pandas as pd
 
@@ -233,4 +229,7 @@ def main():
     return True
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=10
+    )
     main()
\ No newline at end of file
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# the modules in src import each other by bare name
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(
+            os.path.dirname(
+                os.path.abspath(__file__)
+            )
+        ),
+        "src"
+    )
+)
+
+from kernels import HAS_NUMBA
+
+
+@pytest.fixture(params=[False, True] if HAS_NUMBA else [False])
+def use_numba(request):
+    """run a test against the numpy path and, when installed, numba"""
+    return request.param
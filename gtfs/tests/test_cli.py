@@ -0,0 +1,57 @@
+import io
+import os
+import csv
+import sys
+import subprocess
+from zipfile import ZipFile
+
+import pytest
+
+import cli
+
+HEAVY_MODULES = ["pandas", "numpy", "PyPDF2"]
+
+
+def test_routes_quotes_commas(tmp_path, capsys):
+    zip_path = tmp_path / "feed.zip"
+    with ZipFile(zip_path, "w") as zf:
+        zf.writestr(
+            "routes.txt",
+            'route_id,route_short_name,route_long_name\n9,9,"Powell, Broadway"\n'
+        )
+    cli.main(["routes", str(zip_path)])
+    rows = list(csv.reader(io.StringIO(capsys.readouterr().out)))
+    assert rows == [
+        ["route_id","route_short_name","route_long_name"],
+        ["9","9","Powell, Broadway"]
+    ]
+
+
+def test_missing_zip_is_a_usage_error(tmp_path, capsys):
+    with pytest.raises(SystemExit) as e:
+        cli.main(["routes", str(tmp_path / "missing.zip")])
+    assert e.value.code == 2
+    assert "missing.zip" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("command", [["cache"], ["scores"]])
+def test_cached_commands_skip_heavy_imports(command):
+    # a fresh interpreter, since this test session already has pandas loaded.
+    # scores exits with a usage error when there is no cached output, which
+    # is fine - it must still get there without the heavy imports
+    script = (
+        "import sys, cli\n"
+        "try:\n"
+        f"    cli.main({command!r})\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])\n"
+    )
+    res = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=os.path.dirname(cli.__file__),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    assert res.stdout.strip().splitlines()[-1] == "[]"
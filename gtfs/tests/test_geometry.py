@@ -0,0 +1,224 @@
+from zipfile import ZipFile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from kernels import EARTH_RADIUS_M
+from geometry import ShapeGeometry, _project_stops, _stop_candidates
+from gtfs import GTFS
+
+FEET_PER_METER = 5280 / 1609.344
+
+
+def _out_and_back(gap=40.0):
+    """planar shape north along x=0 for 1920 m, back down x=gap"""
+    y = np.arange(0, 1921, 80.0)
+    px = np.r_[np.zeros(len(y)), np.full(len(y), gap)]
+    py = np.r_[y, y[::-1]]
+    cum = np.r_[0, np.cumsum(np.hypot(np.diff(px), np.diff(py)))]
+    return px, py, cum
+
+
+def _project(px, py, cum, sx, sy, use_numba):
+    return _project_stops(
+        px, py, cum, np.asarray(sx, dtype=float), np.asarray(sy, dtype=float),
+        use_numba=use_numba
+    )
+
+
+def test_project_stays_on_nearby_pass(use_numba):
+    # second stop is 22 m off the outbound pass, 18 m from the return
+    # pass much further along - it must not jump to the return pass
+    out, offset = _project(*_out_and_back(), [0, 22, 0, 0, 0], [0, 300, 600, 900, 1200], use_numba)
+    np.testing.assert_allclose(out, [0, 300, 600, 900, 1200])
+    np.testing.assert_allclose(offset, [0, 22, 0, 0, 0])
+
+
+def test_project_far_stop_is_flagged(use_numba):
+    out, offset = _project(*_out_and_back(), [0, 500, 0, 0], [0, 300, 600, 900], use_numba)
+    assert np.isnan(out[1])
+    assert offset[1] > 100
+    # later stops carry on from the last good stop
+    np.testing.assert_allclose(out[[0, 2, 3]], [0, 600, 900])
+
+
+def test_project_after_long_segment(use_numba):
+    # stops either side of a 5 km segment
+    px = np.array([0, 0, 3000.0])
+    py = np.array([0, 5000, 5000.0])
+    cum = np.array([0, 5000, 8000.0])
+    out, offset = _project(px, py, cum, [0, 3000], [0, 5000], use_numba)
+    np.testing.assert_allclose(out, [0, 8000])
+    np.testing.assert_allclose(offset, [0, 0])
+
+
+@pytest.mark.parametrize("gap", [40.0, 150.0])
+def test_project_return_leg(use_numba, gap):
+    # the first return stop is also within reach of the outbound pass,
+    # it and every stop after it belong on the return pass
+    px, py, cum = _out_and_back(gap)
+    turn = 1920 + gap
+    out, offset = _project(
+        px, py, cum, [0, 0, 0, gap, gap, gap], [0, 600, 1200, 1200, 600, 0], use_numba
+    )
+    np.testing.assert_allclose(out, [0, 600, 1200, turn + 720, turn + 1320, turn + 1920])
+    np.testing.assert_allclose(offset, 0, atol=1e-9)
+
+
+def test_project_stop_just_behind_previous(use_numba):
+    # stops a few meters out of order along the shape are placed level
+    # with the stop before, not on some later pass
+    px, py, cum = _out_and_back()
+    out, _ = _project(px, py, cum, [0, 0, 0], [300, 296, 900], use_numba)
+    np.testing.assert_allclose(out, [300, 300, 900])
+
+
+def test_project_single_point_shape(use_numba):
+    out, offset = _project(
+        np.zeros(1), np.zeros(1), np.zeros(1), [0, 30, 500], [0, 40, 0], use_numba
+    )
+    np.testing.assert_allclose(out[:2], [0, 0])
+    assert np.isnan(out[2])
+    np.testing.assert_allclose(offset, [0, 50, 500])
+
+
+def test_candidates_on_every_pass(use_numba):
+    # a serpentine of 12 passes 20 m apart, the stop is in reach of
+    # 10 of them - more candidates than the compiled path first
+    # allocates room for
+    py = np.repeat(np.arange(12)*20.0, 2)
+    px = np.tile([0, 500.0, 500.0, 0], 6)
+    cum = np.r_[0, np.cumsum(np.hypot(np.diff(px), np.diff(py)))]
+    offsets, along, dist, nearest = _stop_candidates(
+        px, py, cum, np.array([250.0]), np.array([110.0]), 100.0, use_numba
+    )
+    assert offsets.tolist() == [0, 10]
+    assert (np.diff(along) > 0).all()
+    np.testing.assert_allclose(np.sort(dist), np.repeat([10, 30, 50, 70, 90], 2))
+    np.testing.assert_allclose(nearest, [10])
+
+
+def _feed_zip(path, with_dist=True):
+    """one route, one shape running due north, stops on shape points"""
+    lat = 45.50 + 0.002*np.arange(11)
+    feet = EARTH_RADIUS_M * np.radians(lat - lat[0]) * FEET_PER_METER
+    shapes = pd.DataFrame(
+        {
+            "shape_id": "s1",
+            "shape_pt_lat": lat,
+            "shape_pt_lon": -122.6,
+            "shape_pt_sequence": np.arange(1, 12),
+            "shape_dist_traveled": feet
+        }
+    )
+    stop_points = [0, 3, 6, 10]
+    stops = pd.DataFrame(
+        {
+            "stop_id": [100, 101, 102, 103],
+            "stop_lat": lat[stop_points],
+            "stop_lon": -122.6
+        }
+    )
+    stop_times = pd.DataFrame(
+        {
+            "trip_id": np.repeat([1, 2], 4),
+            "arrival_time": ["08:00:00","08:02:00","08:04:00","08:08:00"]
+                + ["08:30:00","08:32:00","08:34:00","08:38:00"],
+            "departure_time": ["08:00:00","08:02:00","08:04:00","08:08:00"]
+                + ["08:30:00","08:32:00","08:34:00","08:38:00"],
+            "stop_id": [100, 101, 102, 103]*2,
+            "stop_sequence": [1, 2, 3, 4]*2,
+            "shape_dist_traveled": np.tile(feet[stop_points], 2)
+        }
+    )
+    trips = pd.DataFrame(
+        {
+            "route_id": [9, 9],
+            "service_id": ["W", "W"],
+            "trip_id": [1, 2],
+            "direction_id": [0, 0],
+            "shape_id": ["s1", "s1"]
+        }
+    )
+    routes = pd.DataFrame(
+        {"route_id": [9], "route_short_name": ["9"], "route_long_name": ["Powell"]}
+    )
+    if not with_dist:
+        shapes = shapes.drop(columns="shape_dist_traveled")
+        stop_times = stop_times.drop(columns="shape_dist_traveled")
+    path.mkdir()
+    zip_path = path / "feed.zip"
+    with ZipFile(zip_path, "w") as zf:
+        for name, df in [
+            ("shapes.txt", shapes), ("stops.txt", stops), ("stop_times.txt", stop_times),
+            ("trips.txt", trips), ("routes.txt", routes)
+        ]:
+            zf.writestr(name, df.to_csv(index=False))
+    return str(zip_path), feet
+
+
+def test_shape_lengths_match_feed_feet(tmp_path):
+    zip_path, feet = _feed_zip(tmp_path / "with")
+    lengths = ShapeGeometry(GTFS(zip_path)).shape_lengths()
+    feed_max = GTFS(zip_path).shapes.groupby("shape_id")["shape_dist_traveled"].max()
+    np.testing.assert_allclose(
+        lengths.set_index("shape_id")["length"] * 5280, feed_max, rtol=1e-6
+    )
+
+
+def test_fallback_matches_feed_distances(tmp_path):
+    with_path, feet = _feed_zip(tmp_path / "with")
+    without_path, _ = _feed_zip(tmp_path / "without", with_dist=False)
+
+    # with the column the feed's own distances are used as-is
+    rt = GTFS(with_path).run_times()
+    np.testing.assert_array_equal(rt["distance"], feet[10])
+    rt_fallback = GTFS(without_path).run_times()
+    np.testing.assert_allclose(rt_fallback["distance"], rt["distance"], rtol=1e-6)
+
+    df, _ = GTFS(with_path).assign_vehicle_id()
+    np.testing.assert_array_equal(df["shape_dist_traveled"], feet[10] / 5280)
+    df_fallback, _ = GTFS(without_path).assign_vehicle_id()
+    np.testing.assert_allclose(
+        df_fallback["shape_dist_traveled"], df["shape_dist_traveled"], rtol=1e-6
+    )
+
+
+def test_segments_and_slow_segments(tmp_path):
+    zip_path, feet = _feed_zip(tmp_path / "with")
+    seg = ShapeGeometry(GTFS(zip_path)).segments()
+    miles = feet[[0, 3, 6, 10]] / 5280
+    np.testing.assert_allclose(
+        seg["segment_distance"].to_numpy()[1:4], np.diff(miles), rtol=1e-6
+    )
+    np.testing.assert_allclose(seg["segment_time"].to_numpy()[1:4], [2, 2, 4])
+    slow = ShapeGeometry(GTFS(zip_path)).slow_segments(max_speed=100)
+    assert len(slow) == 3
+    assert (slow["trips"] == 2).all()
+
+
+def test_zero_distance_segments_are_not_slow(tmp_path):
+    zip_path, _ = _feed_zip(tmp_path / "with")
+    feed = GTFS(zip_path)
+    # a second stop on top of stop 101, scheduled a minute later
+    feed.stops = pd.concat(
+        [feed.stops, feed.stops[feed.stops["stop_id"] == 101].assign(stop_id=104)]
+    )
+    st = feed.stop_times
+    st.loc[st["stop_sequence"] >= 3, "stop_sequence"] += 1
+    extra = st[st["stop_id"] == 101].assign(stop_id=104, stop_sequence=3)
+    extra["arrival_time"] = extra["departure_time"] = ["08:03:00", "08:33:00"]
+    feed.stop_times = pd.concat([st, extra])
+    slow = ShapeGeometry(feed).slow_segments(max_speed=100)
+    assert not ((slow["prior_stop_id"] == 101) & (slow["stop_id"] == 104)).any()
+
+
+def test_no_matching_shapes(tmp_path):
+    zip_path, _ = _feed_zip(tmp_path / "with", with_dist=False)
+    feed = GTFS(zip_path)
+    feed.trips["shape_id"] = "missing"
+    assert ShapeGeometry(feed).stop_distances().empty
+    assert ShapeGeometry(feed).segments().empty
+    rt = feed.run_times()
+    assert rt["distance"].isna().all()
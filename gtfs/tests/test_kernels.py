@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kernels import (
+    _pandas_grouped_diff, group_offsets, grouped_diff, grouped_shift, time_to_seconds
+)
+
+
+@pytest.fixture
+def sorted_frame():
+    # route 2 has a single row, stop_id NaN breaks its own group
+    return pd.DataFrame(
+        {
+            "route_id": [1, 1, 1, 1, 1, 2, 3, 3],
+            "stop_id": [10, 10, 10, np.nan, np.nan, 10, 20, 20],
+            "service_id": ["A", "A", "A", "A", "A", "A", "B", "B"],
+            "departure_time": [7.0, 7.25, 7.75, 8.0, 8.5, 9.0, 6.0, 6.2]
+        }
+    )
+
+
+def test_grouped_diff_matches_shift_and_compare(sorted_frame, use_numba):
+    keys = ["route_id","stop_id","service_id"]
+    offsets = group_offsets(*[sorted_frame[k].to_numpy() for k in keys])
+    res = grouped_diff(sorted_frame["departure_time"], offsets, use_numba=use_numba)
+    expected = _pandas_grouped_diff(sorted_frame, keys, "departure_time")
+    np.testing.assert_allclose(res, expected, equal_nan=True)
+    # NaN keys and the one row group both start fresh
+    assert np.isnan(res[[0, 3, 4, 5, 6]]).all()
+
+
+def test_grouped_shift(sorted_frame, use_numba):
+    offsets = group_offsets(sorted_frame["route_id"].to_numpy())
+    res = grouped_shift(sorted_frame["departure_time"], offsets, use_numba=use_numba)
+    np.testing.assert_allclose(
+        res, [np.nan, 7.0, 7.25, 7.75, 8.0, np.nan, np.nan, 6.0], equal_nan=True
+    )
+
+
+def test_empty():
+    offsets = group_offsets(np.array([]))
+    assert len(grouped_diff(np.array([]), offsets)) == 0
+
+
+def test_time_to_seconds():
+    res = time_to_seconds(
+        [
+            "08:00:00", "25:10:05", "100:00:00",
+            # not zero padded, or padded with spaces
+            "8:05:09", " 7:05:09 ", "8:5:9",
+            # malformed or missing
+            "08:00", "08::00", "8:00:00:00", "8 :00:00", "ab:00:00", "", None, np.nan
+        ]
+    )
+    np.testing.assert_array_equal(
+        res[:6], [28800, 90605, 360000, 29109, 25509, 29109]
+    )
+    assert np.isnan(res[6:]).all()
+    assert len(time_to_seconds([])) == 0
@@ -0,0 +1,144 @@
+import os
+import re
+
+import pandas as pd
+import pytest
+
+import pdf_parser
+from pdf_parser import LINE_PATTERN, parse_data_strict, parse_line, reparse_rejects
+
+PDF_NAME = "stop_level_passenger_census_sorted_by_location_id_2023_01_11.pdf"
+# far side stops rejected, to stand in for a pattern bug
+NO_FAR_SIDE = re.compile(LINE_PATTERN.pattern.replace("NS|FS|AT|OP", "NS|AT|OP"))
+
+
+@pytest.mark.parametrize(
+    "line, row",
+    [
+        ("A Ave & Second St 3 E FS 10 5 15 | 1", [3, 10, 5, 15, 1]),
+        # thousands separators
+        ("W Burnside & SW 6th 792 E NS 784 476 1,260 | 285", [792, 784, 476, 1260, 285]),
+        ("Gresham Transit Center 2253 E AT 1,133 902 2,035 | 341", [2253, 1133, 902, 2035, 341]),
+        # rail stations with no direction
+        ("Beaverton TC WES Station 13066 AT 166 172 338 | 0", [13066, 166, 172, 338, 0]),
+        ("Portland Int'l Airport MAX Station 10579 AT 1,524 1,373 2,897 | 0", [10579, 1524, 1373, 2897, 0]),
+        # digits in the stop name
+        ("2800 Block NE 92nd 20 N AT 1 0 1 | 0", [20, 1, 0, 1, 0]),
+        ("SW Beaverton-Hillsdale & 45th 376 W NS 16 32 48 | 1", [376, 16, 32, 48, 1]),
+    ]
+)
+def test_parse_line(line, row):
+    assert parse_line(line) == (row, None)
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        # short rows, a column missing
+        "Abernethy & Barclay 9 N NS 1 0 | 0",
+        "Abernethy & Barclay 9 N NS 1 0 1 |",
+        # malformed separator
+        "W Burnside & SW 6th 792 E NS 784 476 1,26 | 285",
+        "Stop Location Location ID Direction Position Ons Offs TotalMonthly",
+    ]
+)
+def test_parse_line_no_match(line):
+    assert parse_line(line) == (None, "no match")
+
+
+def test_parse_line_checks_total():
+    assert parse_line("A Ave & Second St 3 E FS 10 5 16 | 1") == (None, "ons + offs != total")
+
+
+def test_override_pattern():
+    # a two letter direction isn't in the published tables, but an
+    # override pattern lets reparse_rejects pick such lines up
+    line = "Foo & Bar 123 NE NS 1 2 3 | 0"
+    assert parse_line(line) == (None, "no match")
+    pattern = re.compile(
+        LINE_PATTERN.pattern.replace("(?P<direction>[NSEW])", "(?P<direction>[NSEW]{1,2})")
+    )
+    assert parse_line(line, pattern) == ([123, 1, 2, 3, 0], None)
+
+
+def test_parse_data_strict_pages():
+    pdf = os.path.join(pdf_parser.DATA_PATH, PDF_NAME)
+    df, rf = parse_data_strict(pdf, pages=[1])
+    assert len(df) == 45
+    assert rf.empty
+    assert df.iloc[1].tolist() == [3, 10, 5, 15, 1]
+    df2, _ = parse_data_strict(pdf, pages=[1, 2])
+    assert len(df2) == 90
+    pd.testing.assert_frame_equal(df2.iloc[:45], df)
+
+    df, rf = parse_data_strict(pdf, pages=[2], pattern=NO_FAR_SIDE)
+    assert len(df) + len(rf) == 45
+    assert (rf["page"] == 2).all() and (rf["file"] == PDF_NAME).all()
+    assert rf["line"].str.contains(" FS ").all()
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """one census pdf, parsed by main() on its first two pages only and
+    with far side stops rejected"""
+    os.symlink(os.path.join(pdf_parser.DATA_PATH, PDF_NAME), tmp_path / PDF_NAME)
+    monkeypatch.setattr(pdf_parser, "DATA_PATH", str(tmp_path))
+    monkeypatch.setattr(pdf_parser, "REJECTS_PATH", str(tmp_path / "rejects.csv"))
+    strict = pdf_parser.parse_data_strict
+
+    def two_pages(file_path, pages=None, pattern=NO_FAR_SIDE):
+        return strict(file_path, pages=pages or [1, 2], pattern=pattern)
+
+    monkeypatch.setattr(pdf_parser, "parse_data_strict", two_pages)
+    pdf_parser.main()
+    return tmp_path
+
+
+def _read(data_dir):
+    return (
+        pd.read_csv(data_dir / "stop_level_ridership_data.csv"),
+        pd.read_csv(data_dir / "rejects.csv")
+    )
+
+
+def test_main_writes_rejects_report(data_dir):
+    data, report = _read(data_dir)
+    assert len(report) > 0
+    assert len(data) + len(report) == 90
+    assert list(report.columns) == ["file","page","line","reason"]
+    assert set(report["page"]) == {1, 2}
+
+
+def test_reparse_recovers_rejected_rows(data_dir):
+    data, report = _read(data_dir)
+    rf = reparse_rejects(data_dir / "rejects.csv")
+    assert rf.empty
+    new_data, new_report = _read(data_dir)
+    # rows that were already there aren't added twice
+    assert len(new_data) == 90
+    assert not new_data.duplicated(subset=["stop_id","date"]).any()
+    pd.testing.assert_frame_equal(new_data.iloc[:len(data)], data)
+    assert new_report.empty
+
+
+def test_reparse_nothing_recovered(data_dir):
+    before = [p.read_text() for p in (
+        data_dir / "stop_level_ridership_data.csv", data_dir / "rejects.csv"
+    )]
+    rf = reparse_rejects(data_dir / "rejects.csv", pattern=NO_FAR_SIDE)
+    assert len(rf) == len(pd.read_csv(data_dir / "rejects.csv"))
+    after = [p.read_text() for p in (
+        data_dir / "stop_level_ridership_data.csv", data_dir / "rejects.csv"
+    )]
+    assert after == before
+
+
+def test_reparse_override_only_reports_listed_lines(data_dir):
+    # this pattern takes far side stops but drops near side ones, which
+    # are already in the data and mustn't show up in the new report
+    no_near_side = re.compile(LINE_PATTERN.pattern.replace("NS|FS|AT|OP", "FS|AT|OP"))
+    rf = reparse_rejects(data_dir / "rejects.csv", pattern=no_near_side)
+    assert rf.empty
+    data, report = _read(data_dir)
+    assert len(data) == 90
+    assert report.empty
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from routing import INF, ConnectionScan
+
+
+class ToyFeed(object):
+    """A -> B -> C on trip 1. From C:
+    - trip 2 leaves 2 min after arrival (a normal transfer) to D
+    - trip 3 leaves 30 s after arrival (under min_transfer) to G,
+      so G is only reached on the later trip 5
+    - E is ~50 m from C, trip 4 runs E -> F (walking transfer)
+    H is too far from everything to be reached"""
+
+    def __init__(self):
+        east = 50 / (111320 * np.cos(np.radians(45.52)))
+        self.stops = pd.DataFrame(
+            {
+                "stop_id": ["A","B","C","D","E","F","G","H"],
+                "stop_lat": [45.50, 45.51, 45.52, 45.53, 45.52, 45.52, 45.52, 46.0],
+                "stop_lon": [
+                    -122.60, -122.60, -122.60, -122.60,
+                    -122.60 + east, -122.55, -122.62, -123.0
+                ]
+            }
+        )
+        self.trips = pd.DataFrame(
+            {
+                "trip_id": [1, 2, 3, 4, 5, 6],
+                "route_id": [1, 2, 3, 4, 3, 1],
+                "service_id": ["W", "W", "W", "W", "W", "S"]
+            }
+        )
+        rows = [
+            (1, "08:00:00", "A"), (1, "08:05:00", "B"), (1, "08:10:00", "C"),
+            (2, "08:12:00", "C"), (2, "08:20:00", "D"),
+            (3, "08:10:30", "C"), (3, "08:15:00", "G"),
+            (4, "08:13:00", "E"), (4, "08:20:00", "F"),
+            (5, "08:25:00", "C"), (5, "08:30:00", "G"),
+            (6, "08:00:00", "A"), (6, "08:01:00", "H"),
+        ]
+        self.stop_times = pd.DataFrame(
+            {
+                "trip_id": [r[0] for r in rows],
+                "arrival_time": [r[1] for r in rows],
+                "departure_time": [r[1] for r in rows],
+                "stop_id": [r[2] for r in rows],
+                "stop_sequence": [1, 2, 3, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2]
+            }
+        )
+        # 2023-01-11 is a wednesday, 2023-01-14 a saturday
+        self.calendar_dates = pd.DataFrame(
+            {
+                "service_id": ["S", "W", "X"],
+                "date": [20230114, 20230111, 20230112],
+                "exception_type": [1, 1, 1]
+            }
+        )
+
+
+@pytest.fixture
+def feed():
+    return ToyFeed()
+
+
+def test_service_ids_for(feed):
+    assert ConnectionScan(feed).service_ids == {"W"}
+    assert ConnectionScan(feed, date="2023-01-14").service_ids == {"S"}
+    with pytest.raises(ValueError):
+        ConnectionScan(feed, date="2023-02-01")
+
+
+def test_footpaths_csr(feed):
+    cs = ConnectionScan(feed)
+    c, e = cs.stop_index.get_loc("C"), cs.stop_index.get_loc("E")
+    assert len(cs.foot_offsets) == len(cs.stops) + 1
+    assert cs.foot_offsets[-1] == len(cs.foot_to) == 2
+    assert list(cs.foot_to[cs.foot_offsets[c]:cs.foot_offsets[c + 1]]) == [e]
+    assert list(cs.foot_to[cs.foot_offsets[e]:cs.foot_offsets[e + 1]]) == [c]
+    # ~50 m at 1.3 m/s
+    assert 38 <= cs.foot_secs[0] <= 40
+
+
+def test_earliest_arrival(feed, use_numba):
+    cs = ConnectionScan(feed, use_numba=use_numba)
+    arr = cs.earliest_arrival("A", "07:59:00")
+    res = dict(zip(cs.stops["stop_id"], arr))
+    hms = lambda t: t[0]*3600 + t[1]*60 + t[2]
+    assert res["A"] == hms((7, 59, 0))
+    # staying on trip 1
+    assert res["B"] == hms((8, 5, 0))
+    assert res["C"] == hms((8, 10, 0))
+    # same stop transfer with 2 min to spare
+    assert res["D"] == hms((8, 20, 0))
+    # walk from C, then trip 4
+    assert res["E"] == hms((8, 10, 0)) + cs.foot_secs[0]
+    assert res["F"] == hms((8, 20, 0))
+    # trip 3 leaves 30 s after arrival, under min_transfer
+    assert res["G"] == hms((8, 30, 0))
+    assert res["H"] == INF
+
+
+def test_min_transfer_zero_catches_short_connection(feed):
+    cs = ConnectionScan(feed, min_transfer=0)
+    arr = cs.earliest_arrival("A", "07:59:00")
+    assert arr[cs.stop_index.get_loc("G")] == 8*3600 + 15*60
+
+
+def test_reachable_respects_max_minutes(feed):
+    cs = ConnectionScan(feed)
+    df = cs.reachable("A", 8.0, max_minutes=15)
+    assert set(df["stop_id"]) == {"A","B","C","E"}
+    assert df["travel_time"].max() <= 15
+
+
+def test_malformed_times_are_dropped(feed):
+    st = feed.stop_times
+    # trip 2 can't be boarded at C, and one missing time on trip 5
+    st.loc[(st["trip_id"] == 2) & (st["stop_id"] == "C"), "departure_time"] = "8:12"
+    st.loc[(st["trip_id"] == 5) & (st["stop_id"] == "G"), "arrival_time"] = np.nan
+    cs = ConnectionScan(feed)
+    assert len(cs.conn_dep) == 4
+    assert cs.conn_dep.min() >= 8*3600
+    arr = cs.earliest_arrival("A", "07:59:00")
+    assert arr[cs.stop_index.get_loc("D")] == INF